@@ -1,43 +1,123 @@
 """ Handles API requests to e621.net """
 
+import asyncio
 import aiohttp
+import orjson
+from typing import Optional
+from urllib.parse import urlencode
 from backend.logger_config import logger
 
 USER_AGENT = "sandydownloader/0.1 (by @biscuit_fox)"
 API_URL = "https://e621.net"
+REQUEST_TIMEOUT = 30 # Seconds, for a whole request including reading the body
+DNS_CACHE_TTL = 300 # Seconds a resolved host is reused by a connector
 
 class E621Client:
     """Handles asynchronous API requests to e621.net"""
 
-    def __init__(self):
+    def __init__(self, cache=None):
+        """`cache` is an optional store with get_cached_response/save_cached_response,
+        used to make conditional requests with ETag/Last-Modified."""
         self.base_url = API_URL
+        self.cache = cache
         self.headers = {
-            "User-Agent": USER_AGENT
+            "User-Agent": USER_AGENT,
+            "Accept-Encoding": "gzip, deflate"  # JSON compresses well, aiohttp decodes it for us
         }
+        self._session: Optional[aiohttp.ClientSession] = None
         logger.debug("E621Client initialized with base URL: %s", self.base_url)
 
-    async def make_request(self, url, params=None):
-        """Handles GET requests to the API asynchronously."""
+    async def __aenter__(self):
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def _get_session(self):
+        """Return the shared session, creating it on first use so connections are kept alive."""
+        if self._session is None or self._session.closed:
+            # Keep idle connections around well past the rate limit gap so they get reused,
+            # and cache DNS so repeated requests skip resolution
+            connector = aiohttp.TCPConnector(
+                limit=10,
+                limit_per_host=4,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=75,
+                force_close=False
+            )
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                connector=connector,
+                auto_decompress=True
+            )
+            logger.debug("Opened new API session")
+        return self._session
+
+    async def aclose(self):
+        """Close the shared session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.debug("Closed API session")
+        self._session = None
+
+    async def make_request(self, url, params=None, cacheable=False):
+        """Handles GET requests to the API asynchronously.
+        Only `cacheable` responses are stored for conditional requests, the rest
+        are rarely asked for again and would cost a database write each."""
         logger.debug("Making request to URL: %s with params: %s", url, params)
-        
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=self.headers, params=params) as response:
-                    if response.status == 200:
-                        logger.debug("Request to %s successful", url)
-                        return await response.json()
-                    else:
-                        logger.error("Request to %s failed with status: %s", url, response.status)
+
+        use_cache = cacheable and self.cache is not None
+        cache_key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        cached = self.cache.get_cached_response(cache_key) if use_cache else None
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        session = await self._get_session()
+        try:
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status == 304 and cached:
+                    logger.debug("Request to %s not modified, using cached response", url)
+                    try:
+                        data = orjson.loads(cached["body"])
+                    except orjson.JSONDecodeError as e:
+                        logger.error("Cached response for %s is not valid JSON: %s", url, e)
+                        self.cache.delete_cached_response(cache_key)
                         return None
-            except aiohttp.ClientError as e:
-                logger.error("Request to %s failed: %s", url, e)
-                return None
+                    self.cache.touch_cached_response(cache_key)
+                    return data
+                elif response.status == 200:
+                    logger.debug("Request to %s successful", url)
+                    body = await response.read()
+                    try:
+                        data = orjson.loads(body)
+                    except orjson.JSONDecodeError as e:
+                        # e.g. an HTML challenge page or a truncated body
+                        logger.error("Response from %s is not valid JSON: %s", url, e)
+                        return None
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    if use_cache and (etag or last_modified):
+                        self.cache.save_cached_response(cache_key, etag, last_modified, body)
+                    return data
+                else:
+                    logger.error("Request to %s failed with status: %s", url, response.status)
+                    return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("Request to %s failed: %s", url, e)
+            return None
 
     async def get_pool(self, pool_id):
         """Fetch a pool by ID asynchronously."""
         url = f"{self.base_url}/pools/{pool_id}.json"
         logger.debug("Fetching pool with ID: %s", pool_id)
-        response = await self.make_request(url)
+        # Pools are checked again on every --update, so they're worth revalidating
+        response = await self.make_request(url, cacheable=True)
         if response:
             logger.debug("Pool %s fetched successfully", pool_id)
         return response
@@ -1,174 +1,283 @@
 """ Main backend module for downloading pools from e621.net """
 
 import asyncio
-import time
 import os
+from collections import OrderedDict
 from backend.api_client import E621Client
 from backend.models import Pool, Post
-from backend.downloader import download_image
-from backend.utils import create_directory, create_internet_shortcut
+from backend.downloader import download_image, create_download_session
+from backend.utils import create_directory, create_internet_shortcut, async_input
 from backend.database import DownloadDatabase
+from backend.rate_limiter import RateLimiter
 from backend.logger_config import logger
 from tqdm.asyncio import tqdm
 
-RATE_LIMIT = 2 # Seconds. e621 API rate limit is 2 requests per second
+RATE_LIMIT = 2 # Requests per second. e621 API rate limit is 2 requests per second
+RATE_BURST = 2 # Requests that can be made back to back before throttling kicks in
+MAX_CONCURRENT_API_REQUESTS = 4 # API requests that can be in flight at the same time
+MAX_CONCURRENT_DOWNLOADS = 8 # File transfers that can run at the same time
+DB_BATCH_SIZE = 50 # Downloaded posts recorded per database transaction
+MAX_CONCURRENT_POOLS = 2 # Pools downloaded at the same time by process_pool_ids
+FETCH_CACHE_SIZE = 512 # Pools and posts each kept in memory once fetched
 
 class E621Downloader:
     def __init__(self, base_download_dir="."):
         """Initialize downloader with API client, rate limiter, and database."""
-        self.client = E621Client()
         self.base_download_dir = base_download_dir
         self.db = DownloadDatabase(base_download_dir=base_download_dir)
-        self.rate_limit = asyncio.Semaphore(1)  # Controls concurrent requests
-        self.last_request_time = 0  # Track last API request
+        self.client = E621Client(cache=self.db)  # Database doubles as the HTTP cache
+        # Shared by every pool being downloaded so they stay under the API limit together
+        self._limiter = RateLimiter(rate=RATE_LIMIT, burst=RATE_BURST, max_concurrency=MAX_CONCURRENT_API_REQUESTS)
+        self._download_sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)  # Caps in-flight file transfers
+        self._download_session = None  # Shared by all file transfers, created on first use
+        # Fetches by ID, least recently used first, so repeat lookups don't cost an API request
+        self._pool_cache = OrderedDict()
+        self._post_cache = OrderedDict()
+
+    async def __aenter__(self):
+        await self.client._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Release network and database resources held by the downloader."""
+        # Cached fetches are shielded from their callers, so they're still running
+        # if the caller was cancelled. Stop them before closing what they use
+        pending = [task for cache in (self._pool_cache, self._post_cache)
+                   for task in cache.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await self.client.aclose()
+        if self._download_session is not None:
+            await self._download_session.close()
+            self._download_session = None
+        self.db.close()
+
+    def _get_download_session(self):
+        """Return the shared file download session, creating it if needed."""
+        if self._download_session is None or self._download_session.closed:
+            self._download_session = create_download_session(limit=MAX_CONCURRENT_DOWNLOADS)
+        return self._download_session
 
     async def rate_limited_request(self, func, *args):
-        """Rate-limited API request function."""
-        async with self.rate_limit:
-            elapsed_time = time.time() - self.last_request_time
-            if elapsed_time < RATE_LIMIT:  # Enforce delay per request
-                await asyncio.sleep(RATE_LIMIT - elapsed_time)
+        """Rate-limited API request function.
+        The rate is counted when a request is sent, so several requests can be
+        waiting on responses at once as long as they were sent far enough apart."""
+        async with self._limiter:
+            return await func(*args)
+
+    def _cached_fetch(self, cache, key, fetch):
+        """Return the task fetching `key`, starting one only if it isn't cached.
+        Concurrent callers share the same task. Failed lookups are dropped from
+        the cache so they're tried again next time."""
+        task = cache.get(key)
+        if task is not None:
+            cache.move_to_end(key)
+            return task
 
-            result = await func(*args)  # Await the function call
-            self.last_request_time = time.time()
-            return result
+        task = asyncio.ensure_future(fetch(key))
+        cache[key] = task
+        if len(cache) > FETCH_CACHE_SIZE:
+            cache.popitem(last=False)
+
+        def forget_failure(done):
+            if done.cancelled() or done.exception() is not None or done.result() is None:
+                if cache.get(key) is done:
+                    del cache[key]
+        task.add_done_callback(forget_failure)
+        return task
 
     async def fetch_pool(self, pool_id):
+        """Retrieve pool data by ID with rate limiting, reusing an earlier result."""
+        # Shielded so a cancelled caller doesn't cancel the fetch for everyone sharing it
+        return await asyncio.shield(self._cached_fetch(self._pool_cache, pool_id, self._fetch_pool))
+
+    async def fetch_post(self, post_id):
+        """Retrieve post data by ID with rate limiting, reusing an earlier result."""
+        return await asyncio.shield(self._cached_fetch(self._post_cache, post_id, self._fetch_post))
+
+    async def _fetch_pool(self, pool_id):
         """Retrieve pool data by ID with rate limiting."""
-        logger.info(f"Fetching pool {pool_id}...")
+        logger.info("Fetching pool %s...", pool_id)
         pool_data = await self.rate_limited_request(self.client.get_pool, pool_id)
         if not pool_data:
-            logger.warning(f"Pool {pool_id} not found.")
+            logger.warning("Pool %s not found.", pool_id)
             return None
         return Pool(pool_data)
 
-    async def fetch_post(self, post_id):
+    async def _fetch_post(self, post_id):
         """Retrieve post data by ID with rate limiting."""
-        logger.debug(f"Fetching post {post_id}...")
+        logger.debug("Fetching post %s...", post_id)
         post_data = await self.rate_limited_request(self.client.get_post, post_id)
         if not post_data:
-            logger.warning(f"Post {post_id} not found.")
+            logger.warning("Post %s not found.", post_id)
             return None
         return Post(post_data)
 
-    async def download_pool(self, pool_id, progress_bar, skip_existing=True):
-        """Download all posts in a pool, optionally skipping existing ones."""
-        pool = await self.fetch_pool(pool_id)
+    async def download_pool(self, pool_id, progress_bar, skip_existing=True, pool=None):
+        """Download all posts in a pool, optionally skipping existing ones.
+        Pass an already fetched `pool` to avoid requesting it again."""
+        if pool is None:
+            pool = await self.fetch_pool(pool_id)
         if not pool or not pool.post_ids:
-            logger.warning(f"Skipping pool {pool_id}, no posts found.")
+            logger.warning("Skipping pool %s, no posts found.", pool_id)
             return
 
         # Check for existing pool info in database
         existing_pool = self.db.get_pool_info(pool_id)
         
         if existing_pool:
-            logger.info(f"Found existing pool record in database: {existing_pool['name']}")
-            logger.info(f"  - Artist: {existing_pool['artist']}")
-            logger.info(f"  - Post count: {existing_pool['post_count']}")
-            logger.info(f"  - Directory: {existing_pool['folder_path']}")
+            logger.info("Found existing pool record in database: %s", existing_pool['name'])
+            logger.info("  - Artist: %s", existing_pool['artist'])
+            logger.info("  - Post count: %s", existing_pool['post_count'])
+            logger.info("  - Directory: %s", existing_pool['folder_path'])
         else:
-            logger.info(f"Pool {pool_id} not found in database - will create new record")
+            logger.info("Pool %s not found in database - will create new record", pool_id)
         
-        # Determine artist name
-        logger.info(f"Fetching first post to determine artist...")
-        first_post = await self.fetch_post(pool.post_ids[0])
-        if not first_post:
-            logger.error(f"Failed to fetch first post {pool.post_ids[0]} for artist detection")
-            return
+        # Reuse the pool's folder whenever it's still there
+        reuse_folder = bool(existing_pool) and os.path.exists(existing_pool['folder_path'])
+
+        # Determine artist name, only asking the API when the database doesn't know it
+        artist = existing_pool['artist'] if existing_pool else None
+        if not artist:
+            logger.info("Fetching first post to determine artist...")
+            if not reuse_folder:
+                # Every post goes into a new folder, so look up the next few alongside the first
+                # instead of leaving API slots idle while the folder is set up. The lookups are
+                # cached, so the workers downloading these posts later don't request them again
+                for post_id in pool.post_ids[:MAX_CONCURRENT_API_REQUESTS]:
+                    self._cached_fetch(self._post_cache, post_id, self._fetch_post)
+            first_post = await self.fetch_post(pool.post_ids[0])
+            if not first_post:
+                logger.error("Failed to fetch first post %s for artist detection", pool.post_ids[0])
+                return
 
-        artist = first_post.artists[1] if first_post.artists and first_post.artists[0] == "conditional_dnp" and len(first_post.artists) > 1 else first_post.artists[0] if first_post.artists else "Unknown Artist"
-        logger.info(f"Detected artist: {artist}")
+            artist = first_post.primary_artist
+            logger.info("Detected artist: %s", artist)
 
         # Determine working directory
-        if existing_pool and os.path.exists(existing_pool['folder_path']):
+        if reuse_folder:
             # Use existing directory
             working_dir = existing_pool['folder_path']
-            logger.info(f"Using existing directory: {working_dir}")
+            logger.info("Using existing directory: %s", working_dir)
         else:
             # Create new directory
-            logger.info(f"Creating new directory for pool: {pool.name}")
+            logger.info("Creating new directory for pool: %s", pool.name)
             working_dir = create_directory(pool.name, artist, self.base_download_dir)
-            logger.info(f"Created directory: {working_dir}")
-            create_internet_shortcut(f"https://e621.net/pools/{pool.id}", working_dir, working_dir)
-            logger.info(f"Created pool shortcut in directory")
+            logger.info("Created directory: %s", working_dir)
+            await create_internet_shortcut(f"https://e621.net/pools/{pool.id}", working_dir, os.path.basename(working_dir))
+            logger.info("Created pool shortcut in directory")
 
         # Save/update pool info in database
         self.db.save_pool(pool_id, pool.name, artist, working_dir, pool.post_count)
-        logger.info(f"Pool information saved to database")
+        logger.info("Pool information saved to database")
 
         if skip_existing:
-            logger.info(f"Checking for existing downloads (skip_existing=True)")
+            logger.info("Checking for existing downloads (skip_existing=True)")
             
-            # Verify existing files and clean up missing ones
-            logger.info(f"Verifying downloaded files against filesystem...")
-            missing_files = self.db.verify_downloaded_files(pool_id)
-            if missing_files:
-                logger.info(f"Found {len(missing_files)} missing files in filesystem, will re-download")
-            else:
-                logger.info(f"All previously downloaded files verified as present")
-
-            # Get posts that need to be downloaded
-            posts_to_download = self.db.get_missing_posts(pool_id, pool.post_ids)
+            # Verify existing files, clean up missing ones and get posts that need to be downloaded
+            logger.info("Verifying downloaded files against filesystem...")
+            posts_to_download = self.db.sync_pool_state(pool_id, pool.post_ids)
             
             if not posts_to_download:
-                logger.info(f"Pool {pool.name} is already fully downloaded! ({pool.post_count} posts)")
+                logger.info("Pool %s is already fully downloaded! (%s posts)", pool.name, pool.post_count)
                 return
             
             already_downloaded = pool.post_count - len(posts_to_download)
-            logger.info(f"Download plan: {already_downloaded} posts already downloaded, {len(posts_to_download)} posts need downloading")
-            logger.info(f"Downloading {len(posts_to_download)} new/missing posts from pool: {pool.name} (Total: {pool.post_count})")
+            logger.info("Download plan: %s posts already downloaded, %s posts need downloading", already_downloaded, len(posts_to_download))
+            logger.info("Downloading %s new/missing posts from pool: %s (Total: %s)", len(posts_to_download), pool.name, pool.post_count)
         else:
             posts_to_download = pool.post_ids
-            logger.info(f"Re-downloading ALL posts (skip_existing=False)")
-            logger.info(f"Re-downloading all {pool.post_count} posts from pool: {pool.name}")
-
-        async def track_download(post_id, directory):
-            """Download a single post, update progress, and yield result."""
-            # Find the position of this post in the original pool order
-            position = pool.post_ids.index(post_id)
-            result = await self.download_post(post_id, position, directory, pool_id)
-            progress_bar.update(1)
-            yield result  # Yield success/failure info
-
-        # Download missing posts with rate limiting and collect results
-        for post_id in posts_to_download:
-            async for result in track_download(post_id, working_dir):
+            logger.info("Re-downloading ALL posts (skip_existing=False)")
+            logger.info("Re-downloading all %s posts from pool: %s", pool.post_count, pool.name)
+
+        # Queue posts with their position in the original pool order
+        needed = set(posts_to_download)
+        post_queue = asyncio.Queue()
+        for position, post_id in enumerate(pool.post_ids):
+            if post_id in needed:
+                post_queue.put_nowait((position, post_id))
+        result_queue = asyncio.Queue()
+
+        async def worker():
+            """Download queued posts until there are none left, passing results back."""
+            while True:
+                try:
+                    position, post_id = post_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await self.download_post(post_id, position, working_dir, pool_id)
+                except Exception as e:
+                    await result_queue.put(e)  # Re-raised by the consumer below
+                    return
+                await result_queue.put(result)
+
+        # Download missing posts with a few workers and yield results as they finish,
+        # recording them in the database in batches rather than one commit per post
+        total = post_queue.qsize()
+        workers = [asyncio.create_task(worker()) for _ in range(min(MAX_CONCURRENT_DOWNLOADS, total))]
+        downloaded = []
+        try:
+            for _ in range(total):
+                result = await result_queue.get()
+                if isinstance(result, Exception):
+                    raise result
+                if result["status"] == "downloaded":
+                    downloaded.append((result["post_id"], pool_id, result["file_path"], result["position"]))
+                    if len(downloaded) >= DB_BATCH_SIZE:
+                        self.db.mark_posts_downloaded(downloaded)
+                        downloaded = []
+                progress_bar.update(1)
                 yield result  # Pass results back to process_pool_ids
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if downloaded:
+                self.db.mark_posts_downloaded(downloaded)
         
     async def download_post(self, post_id, index, directory, pool_id):
-        """Download a single post with rate limiting and database tracking."""
+        """Download a single post with rate limiting. The caller records it in the database."""
         post = await self.fetch_post(post_id)
         if post:
             filename = f"{index + 1}.{post.file_ext}"
             file_path = os.path.join(directory, filename)
             
-            await download_image(post, index, directory)
-            
-            # Mark as downloaded in database
-            self.db.mark_post_downloaded(post_id, pool_id, file_path, index)
+            # File transfers go to the static host, so they aren't rate limited like the API
+            async with self._download_sem:
+                saved = await download_image(self._get_download_session(), post, index, directory)
             
-            logger.debug(f"Downloaded post {post.id}")
-            return {"post_id": post.id, "status": "downloaded"}
-        logger.warning(f"Failed to download post {post_id}")
+            if saved:
+                logger.debug("Downloaded post %s", post.id)
+                return {"post_id": post.id, "status": "downloaded", "file_path": file_path, "position": index}
+        logger.warning("Failed to download post %s", post_id)
         return {"post_id": post_id, "status": "failed"}
 
-    async def check_pool_for_updates(self, pool_id):
-        """Check if a pool has new posts since last download."""
-        logger.info(f"Checking pool {pool_id} for updates...")
+    async def check_pool_for_updates(self, pool_id, stored_pool=None, downloaded_posts=None):
+        """Check if a pool has new posts since last download.
+        `stored_pool` and `downloaded_posts` can be passed in when the caller has
+        already loaded them in bulk, otherwise they're read from the database."""
+        logger.info("Checking pool %s for updates...", pool_id)
         
         # Get current pool data from API
         current_pool = await self.fetch_pool(pool_id)
         if not current_pool:
-            logger.warning(f"Could not fetch current data for pool {pool_id}")
+            logger.warning("Could not fetch current data for pool %s", pool_id)
             return None
         
         # Get stored pool data from database
-        stored_pool = self.db.get_pool_info(pool_id)
+        if stored_pool is None:
+            stored_pool = self.db.get_pool_info(pool_id)
         if not stored_pool:
-            logger.info(f"Pool {pool_id} not found in database - treating as new pool")
+            logger.info("Pool %s not found in database - treating as new pool", pool_id)
             return {
                 'pool_id': pool_id,
                 'pool_name': current_pool.name,
+                'pool': current_pool,
                 'has_updates': True,
                 'old_count': 0,
                 'new_count': current_pool.post_count,
@@ -181,22 +290,27 @@ class E621Downloader:
         
         if new_count > old_count:
             # Get posts that need to be downloaded
-            missing_posts = self.db.get_missing_posts(pool_id, current_pool.post_ids)
+            if downloaded_posts is None:
+                missing_posts = self.db.get_missing_posts(pool_id, current_pool.post_ids)
+            else:
+                missing_posts = [post_id for post_id in current_pool.post_ids if post_id not in downloaded_posts]
             
-            logger.info(f"Pool '{current_pool.name}' has {new_count - old_count} new posts")
+            logger.info("Pool '%s' has %s new posts", current_pool.name, new_count - old_count)
             return {
                 'pool_id': pool_id,
                 'pool_name': current_pool.name,
+                'pool': current_pool,
                 'has_updates': True,
                 'old_count': old_count,
                 'new_count': new_count,
                 'new_posts': len(missing_posts)
             }
         else:
-            logger.info(f"Pool '{current_pool.name}' is up to date ({new_count} posts)")
+            logger.info("Pool '%s' is up to date (%s posts)", current_pool.name, new_count)
             return {
                 'pool_id': pool_id,
                 'pool_name': current_pool.name,
+                'pool': current_pool,
                 'has_updates': False,
                 'old_count': old_count,
                 'new_count': new_count,
@@ -204,64 +318,98 @@ class E621Downloader:
             }
 
 
-async def process_pool_ids(pool_ids, skip_existing=True, base_download_dir="."):
-    """Process multiple pool IDs asynchronously with progress tracking."""
-    downloader = E621Downloader(base_download_dir=base_download_dir)
+async def process_pool_ids(pool_ids, skip_existing=True, base_download_dir=".", downloader=None, prefetched_pools=None):
+    """Process multiple pool IDs asynchronously with progress tracking.
+    Pass an open `downloader` to reuse its connections, otherwise one is created.
+    `prefetched_pools` maps pool IDs to Pool objects that don't need fetching again."""
+    if downloader is None:
+        async with E621Downloader(base_download_dir=base_download_dir) as downloader:
+            return await process_pool_ids(pool_ids, skip_existing, base_download_dir, downloader, prefetched_pools)
 
-    logger.info(f"Starting download process for {len(pool_ids)} pool(s)")
-    logger.info(f"Base download directory: {base_download_dir}")
-    logger.info(f"Skip existing files: {skip_existing}")
+    # A pool listed twice would have two tasks writing the same files
+    pool_ids = list(dict.fromkeys(pool_ids))
 
-    all_failed = {}  # Store failed downloads for retrying later
+    logger.info("Starting download process for %s pool(s)", len(pool_ids))
+    logger.info("Base download directory: %s", base_download_dir)
+    logger.info("Skip existing files: %s", skip_existing)
 
-    for i, pool_id in enumerate(pool_ids, 1):
-        logger.info(f"Processing pool {i}/{len(pool_ids)}: {pool_id}")
-        
-        # Fetch pool info before creating a progress bar
-        pool = await downloader.fetch_pool(pool_id)
-        if not pool:
-            logger.warning(f"Skipping pool {pool_id}, no valid data.")
-            continue
+    all_failed = {}  # Store failed downloads for retrying later
 
-        pool_name = pool.name
-        logger.info(f"Pool details: '{pool_name}' ({pool.post_count} posts)")
-        success, failed = [], []
+    # Each slot is a progress bar line, taking one caps how many pools download at once
+    bar_slots = asyncio.Queue()
+    for slot in range(min(MAX_CONCURRENT_POOLS, len(pool_ids))):
+        bar_slots.put_nowait(slot)
 
-        if skip_existing:
-            # Get the number of posts that actually need downloading
-            missing_posts = downloader.db.get_missing_posts(pool_id, pool.post_ids)
-            total_images = len(missing_posts)
+    async def process_pool(i, pool_id):
+        """Download one pool while holding a progress bar slot."""
+        slot = await bar_slots.get()
+        try:
+            logger.info("Processing pool %s/%s: %s", i, len(pool_ids), pool_id)
             
-            if total_images == 0:
-                tqdm.write(f"Pool {pool_name} is already complete!")
-                logger.info(f"Pool {pool_name} is already complete!")
-                continue
-        else:
-            total_images = pool.post_count
+            # Fetch pool info before creating a progress bar
+            pool = prefetched_pools.get(pool_id) if prefetched_pools else None
+            if pool is None:
+                pool = await downloader.fetch_pool(pool_id)
+            if not pool:
+                logger.warning("Skipping pool %s, no valid data.", pool_id)
+                return
+
+            pool_name = pool.name
+            logger.info("Pool details: '%s' (%s posts)", pool_name, pool.post_count)
+            success, failed = [], []
+
+            if skip_existing:
+                # Get the number of posts that actually need downloading
+                missing_posts = downloader.db.get_missing_posts(pool_id, pool.post_ids)
+                total_images = len(missing_posts)
+                
+                if total_images == 0:
+                    tqdm.write(f"Pool {pool_name} is already complete!")
+                    logger.info("Pool %s is already complete!", pool_name)
+                    return
+            else:
+                total_images = pool.post_count
 
-        # Create a new progress bar for this pool
-        with tqdm(total=total_images, desc=f"Downloading {pool_name}", unit="image", position=0, leave=True) as progress_bar:
-            async for post_result in downloader.download_pool(pool_id, progress_bar, skip_existing):
-                if post_result["status"] == "downloaded":
-                    success.append(post_result["post_id"])
-                else:
-                    failed.append(post_result["post_id"])
+            # Create a new progress bar for this pool
+            with tqdm(total=total_images, desc=f"Downloading {pool_name}", unit="image", position=slot, leave=True) as progress_bar:
+                async for post_result in downloader.download_pool(pool_id, progress_bar, skip_existing, pool=pool):
+                    if post_result["status"] == "downloaded":
+                        success.append(post_result["post_id"])
+                    else:
+                        failed.append(post_result["post_id"])
 
-        # Print success message after pool download completes
-        if success:
-            tqdm.write(f"Successfully downloaded {len(success)} images for {pool_name}")
+            # Print success message after pool download completes
+            if success:
+                tqdm.write(f"Successfully downloaded {len(success)} images for {pool_name}")
 
-        # Store failed downloads for potential retrying
-        if failed:
-            all_failed[pool_id] = failed
+            # Store failed downloads for potential retrying
+            if failed:
+                all_failed[pool_id] = failed
+        finally:
+            bar_slots.put_nowait(slot)
+
+    # Pools share the downloader's rate limiter, so running a few at once
+    # overlaps their setup and tail ends without exceeding the API limit
+    tasks = [asyncio.ensure_future(process_pool(i, pool_id)) for i, pool_id in enumerate(pool_ids, 1)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # gather leaves the other pools running when one fails, stop them
+        # before the caller closes the downloader they're using
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     return all_failed  # Return failed downloads for retrying later
 
 
-async def update_all_pools(base_download_dir="."):
-    """Check all previously downloaded pools for updates and download new posts."""
-    downloader = E621Downloader(base_download_dir=base_download_dir)
-    
+async def update_all_pools(base_download_dir=".", downloader=None):
+    """Check all previously downloaded pools for updates and download new posts.
+    Pass an open `downloader` to reuse its connections, otherwise one is created."""
+    if downloader is None:
+        async with E621Downloader(base_download_dir=base_download_dir) as downloader:
+            return await update_all_pools(base_download_dir, downloader)
+
     # Get all pools from database
     all_pools = downloader.db.get_all_downloaded_pools()
     
@@ -269,15 +417,22 @@ async def update_all_pools(base_download_dir="."):
         logger.info("No pools found in database to update")
         return
     
-    logger.info(f"Checking {len(all_pools)} pools for updates...")
+    logger.info("Checking %s pools for updates...", len(all_pools))
     
     pools_with_updates = []
     
+    # Load what we know about every pool up front, rather than querying per pool
+    downloaded_by_pool = downloader.db.get_downloaded_posts_bulk([pool_info['id'] for pool_info in all_pools])
+    
     # Check each pool for updates
     for pool_info in all_pools:
         pool_id = pool_info['id']
-        update_info = await downloader.check_pool_for_updates(pool_id)
-        
+        update_info = await downloader.check_pool_for_updates(
+            pool_id,
+            stored_pool=pool_info,
+            downloaded_posts=set(downloaded_by_pool[pool_id])
+        )
+    
         if update_info and update_info['has_updates']:
             pools_with_updates.append(update_info)
     
@@ -287,34 +442,47 @@ async def update_all_pools(base_download_dir="."):
         return
     
     # Show summary of updates found
-    logger.info(f"Found updates for {len(pools_with_updates)} pools:")
+    logger.info("Found updates for %s pools:", len(pools_with_updates))
     print(f"\nFound updates for {len(pools_with_updates)} pools:")
     for update in pools_with_updates:
         update_msg = f"  - {update['pool_name']}: {update['old_count']} -> {update['new_count']} posts (+{update['new_posts']} new)"
         logger.info(update_msg)
         print(update_msg)
     
+    # Don't leave idle connections to go stale while waiting on the user,
+    # the session is reopened on the next request
+    await downloader.client.aclose()
+
     # Ask user if they want to proceed with downloads
     try:
-        response = input(f"\nDownload updates for {len(pools_with_updates)} pools? [Y/n]: ").strip().lower()
+        response = (await async_input(f"\nDownload updates for {len(pools_with_updates)} pools? [Y/n]: ")).strip().lower()
         if response and response not in ['y', 'yes']:
             logger.info("Update cancelled by user")
             print("Update cancelled by user")
             return
-    except KeyboardInterrupt:
+    except asyncio.CancelledError:
+        # The prompt is read on another thread, so Ctrl+C arrives here as the
+        # main task being cancelled rather than as a KeyboardInterrupt
         logger.info("Update cancelled by user")
         print("\nUpdate cancelled by user")
-        return
+        raise
     
     # Download updates
     pool_ids_to_update = [update['pool_id'] for update in pools_with_updates]
-    logger.info(f"Downloading updates for {len(pool_ids_to_update)} pools...")
+    prefetched_pools = {update['pool_id']: update['pool'] for update in pools_with_updates}
+    logger.info("Downloading updates for %s pools...", len(pool_ids_to_update))
     
-    failed_downloads = await process_pool_ids(pool_ids_to_update, skip_existing=True, base_download_dir=base_download_dir)
+    failed_downloads = await process_pool_ids(
+        pool_ids_to_update,
+        skip_existing=True,
+        base_download_dir=base_download_dir,
+        downloader=downloader,
+        prefetched_pools=prefetched_pools
+    )
     
     if failed_downloads:
-        logger.warning(f"Some downloads failed: {failed_downloads}")
+        logger.warning("Some downloads failed: %s", failed_downloads)
         print(f"⚠️  Some downloads failed: {len(failed_downloads)} pools had issues")
     else:
         logger.info("All pool updates completed successfully!")
-        print("All pool updates completed successfully!")
\ No newline at end of file
+        print("All pool updates completed successfully!")
@@ -2,20 +2,40 @@
 
 import sqlite3
 import os
+import time
 from pathlib import Path
 from backend.logger_config import logger
 from contextlib import contextmanager
 
+MAX_QUERY_PARAMS = 500 # IDs per IN (...) query, well under SQLite's variable limit
+HTTP_CACHE_MAX_AGE = 30 * 24 * 60 * 60 # Seconds a cached API response is kept before it's pruned
+
 class DownloadDatabase:
     def __init__(self, db_path="e6dl_downloads.db", base_download_dir="."):
         """Initialize the database connection."""
         self.db_path = db_path
         self.base_download_dir = Path(base_download_dir)
+        # Computed once here, the path helpers run for every record
+        self._base_str = os.path.abspath(base_download_dir)
+        
+        # One connection is kept open for the lifetime of the database object
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row  # Enable dict-like access
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, avoids an fsync per commit
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        self._conn.execute('PRAGMA cache_size=-64000')  # 64MB page cache
+        
         self._init_database()
     
+    def close(self):
+        """Close the database connection."""
+        self._conn.close()
+        logger.debug("Database connection closed")
+    
     def _init_database(self):
         """Create the database tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             
             # Table for pools
@@ -43,45 +63,51 @@ class DownloadDatabase:
                 )
             ''')
             
+            # Indexes for per-pool lookups and listing pools by recency
+            # (the downloaded_posts primary key starts with post_id, so it can't serve pool_id lookups)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_dp_pool ON downloaded_posts (pool_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pools_updated ON pools (last_updated DESC)')
+            
+            # Table for cached API responses, used for conditional requests
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body BLOB NOT NULL,
+                    fetched_at REAL
+                )
+            ''')
+            # Drop responses that haven't been fetched or revalidated in a while so the table doesn't keep growing
+            cursor.execute('DELETE FROM http_cache WHERE fetched_at < ?', (time.time() - HTTP_CACHE_MAX_AGE,))
+            
             conn.commit()
             logger.debug("Database initialized")
     
     def _to_relative_path(self, absolute_path):
         """Convert absolute path to relative path from base download directory."""
-        try:
-            abs_path = Path(absolute_path).resolve()
-            base_path = self.base_download_dir.resolve()
-            
-            # If the path is under our base directory, make it relative
-            if str(abs_path).startswith(str(base_path)):
-                return str(abs_path.relative_to(base_path))
-            else:
-                # If it's outside our base directory, store as absolute for safety
-                return str(abs_path)
-        except (ValueError, OSError):
-            # Fallback to storing as-is if there are any path issues
-            return str(absolute_path)
+        abs_path = os.path.abspath(absolute_path)
+        
+        # If the path is under our base directory, make it relative
+        if abs_path.startswith(self._base_str + os.sep):
+            return os.path.relpath(abs_path, self._base_str)
+        else:
+            # If it's outside our base directory, store as absolute for safety
+            return abs_path
     
     def _to_absolute_path(self, stored_path):
         """Convert stored path to absolute path."""
-        path = Path(stored_path)
-        
         # If it's already absolute, return as-is
-        if path.is_absolute():
-            return str(path)
+        if os.path.isabs(stored_path):
+            return stored_path
         
-        # Otherwise, resolve relative to base download directory
-        return str((self.base_download_dir / path).resolve())
+        # Otherwise, it's relative to the base download directory
+        return os.path.normpath(os.path.join(self._base_str, stored_path))
     
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Context manager for database access, yields the shared connection."""
+        yield self._conn
     
     def get_pool_info(self, pool_id):
         """Get existing pool information from database."""
@@ -110,7 +136,7 @@ class DownloadDatabase:
                 VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
             ''', (pool_id, name, artist, relative_path, post_count))
             conn.commit()
-            logger.debug(f"Pool {pool_id} saved to database with relative path: {relative_path}")
+            logger.debug("Pool %s saved to database with relative path: %s", pool_id, relative_path)
     
     def get_downloaded_posts(self, pool_id):
         """Get list of downloaded post IDs for a pool."""
@@ -119,83 +145,133 @@ class DownloadDatabase:
             cursor.execute('SELECT post_id FROM downloaded_posts WHERE pool_id = ?', (pool_id,))
             return [row[0] for row in cursor.fetchall()]
     
+    def get_downloaded_posts_bulk(self, pool_ids):
+        """Get downloaded post IDs for several pools at once, as {pool_id: [post_ids]}."""
+        pool_ids = list(pool_ids)
+        downloaded = {pool_id: [] for pool_id in pool_ids}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(pool_ids), MAX_QUERY_PARAMS):
+                chunk = pool_ids[start:start + MAX_QUERY_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'SELECT pool_id, post_id FROM downloaded_posts WHERE pool_id IN ({placeholders})', chunk)
+                for pool_id, post_id in cursor.fetchall():
+                    downloaded[pool_id].append(post_id)
+        return downloaded
+    
     def mark_post_downloaded(self, post_id, pool_id, file_path, position):
         """Mark a post as downloaded."""
+        self.mark_posts_downloaded([(post_id, pool_id, file_path, position)])
+        logger.debug("Post %s marked as downloaded", post_id)
+    
+    def mark_posts_downloaded(self, records):
+        """Mark several posts as downloaded in a single transaction.
+        Each record is a (post_id, pool_id, file_path, position) tuple."""
+        # Store paths as relative
+        rows = [(post_id, pool_id, self._to_relative_path(file_path), position)
+                for post_id, pool_id, file_path, position in records]
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            # Store path as relative
-            relative_path = self._to_relative_path(file_path)
-            cursor.execute('''
+            conn.executemany('''
                 INSERT OR REPLACE INTO downloaded_posts 
                 (post_id, pool_id, file_path, position, downloaded_at) 
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (post_id, pool_id, relative_path, position))
+            ''', rows)
             conn.commit()
-            logger.debug(f"Post {post_id} marked as downloaded at relative path: {relative_path}")
+        logger.debug("Marked %d posts as downloaded", len(rows))
     
     def get_missing_posts(self, pool_id, all_post_ids):
-        """Get list of post IDs that haven't been downloaded yet."""
-        downloaded = set(self.get_downloaded_posts(pool_id))
-        all_posts = set(all_post_ids)
-        return list(all_posts - downloaded)
+        """Get list of post IDs that haven't been downloaded yet, in pool order.
+        The comparison happens inside SQLite, using a temporary table of the candidates."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS candidate_posts (position INTEGER PRIMARY KEY, post_id INTEGER)')
+            cursor.execute('DELETE FROM candidate_posts')
+            cursor.executemany('INSERT INTO candidate_posts (position, post_id) VALUES (?, ?)', enumerate(all_post_ids))
+            cursor.execute('''
+                SELECT c.post_id FROM candidate_posts c
+                LEFT JOIN downloaded_posts d ON d.post_id = c.post_id AND d.pool_id = ?
+                WHERE d.post_id IS NULL
+                ORDER BY c.position
+            ''', (pool_id,))
+            missing = [row[0] for row in cursor.fetchall()]
+            cursor.execute('DELETE FROM candidate_posts')
+            conn.commit()
+            return missing
     
     def verify_downloaded_files(self, pool_id):
         """Verify that downloaded files still exist and remove missing ones from DB.
         Also detect orphaned files that exist but aren't tracked in the database."""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT post_id, file_path, position FROM downloaded_posts WHERE pool_id = ?', (pool_id,))
-            records = cursor.fetchall()
-            
-            # Get pool info to know where files should be
-            pool_info = self.get_pool_info(pool_id)
-            if not pool_info:
-                logger.warning(f"Pool {pool_id} not found in database, cannot verify files")
-                return []
-            
-            folder_path = Path(pool_info['folder_path'])
-            logger.info(f"Checking {len(records)} database records against filesystem in: {folder_path}")
-            
-            # Track which positions are accounted for in the database
-            db_positions = {}  # position -> post_id mapping
-            db_file_paths = set()  # Track all database file paths
-            
-            missing_files = []
-            for post_id, stored_path, position in records:
-                # Convert to absolute path for existence check
-                absolute_path = self._to_absolute_path(stored_path)
-                db_file_paths.add(absolute_path.lower())  # Store lowercase for comparison
-                db_positions[position] = post_id
-                
-                if not os.path.exists(absolute_path):
-                    missing_files.append(post_id)
-                    cursor.execute('DELETE FROM downloaded_posts WHERE post_id = ? AND pool_id = ?', (post_id, pool_id))
-                    logger.info(f"Removed missing file record: post {post_id} (expected at {absolute_path})")
+            missing_files, _ = self._verify_pool_files(conn, pool_id)
+            return missing_files
+    
+    def sync_pool_state(self, pool_id, post_ids):
+        """Verify a pool's files and return the post IDs that still need downloading,
+        in pool order. Does the job of verify_downloaded_files() followed by
+        get_missing_posts() with a single read of the pool's records."""
+        with self.get_connection() as conn:
+            _, present_posts = self._verify_pool_files(conn, pool_id)
+        return [post_id for post_id in post_ids if post_id not in present_posts]
+    
+    def _verify_pool_files(self, conn, pool_id):
+        """Check a pool's records against the filesystem on an open connection.
+        Returns the post IDs whose files were missing, and the set of post IDs
+        still recorded as downloaded."""
+        cursor = conn.cursor()
+        cursor.execute('SELECT post_id, file_path, position FROM downloaded_posts WHERE pool_id = ?', (pool_id,))
+        records = cursor.fetchall()
+        
+        # Get the pool's folder to know where files should be
+        cursor.execute('SELECT folder_path FROM pools WHERE id = ?', (pool_id,))
+        pool_row = cursor.fetchone()
+        if not pool_row:
+            logger.warning("Pool %s not found in database, cannot verify files", pool_id)
+            return [], {record[0] for record in records}
+        
+        folder_path = Path(self._to_absolute_path(pool_row['folder_path']))
+        logger.info("Checking %s database records against filesystem in: %s", len(records), folder_path)
+        
+        # Track which positions are accounted for in the database
+        db_positions = {}  # position -> post_id mapping
+        db_file_names = set()  # Track file names in the database, files in a pool folder have unique names
+        
+        missing_files = []
+        for post_id, stored_path, position in records:
+            # Convert to absolute path for existence check
+            absolute_path = self._to_absolute_path(stored_path)
+            db_file_names.add(os.path.basename(absolute_path).lower())  # Store lowercase for comparison
+            db_positions[position] = post_id
             
-            # Check for orphaned files (files that exist but aren't in database)
-            orphaned_files = 0
-            if folder_path.exists():
-                for file_path in folder_path.iterdir():
-                    if file_path.is_file() and not file_path.name.endswith('.url'):  # Skip .url shortcuts
-                        abs_file_path = str(file_path.resolve())
-                        
+            if not os.path.exists(absolute_path):
+                missing_files.append(post_id)
+                cursor.execute('DELETE FROM downloaded_posts WHERE post_id = ? AND pool_id = ?', (post_id, pool_id))
+                logger.info("Removed missing file record: post %s (expected at %s)", post_id, absolute_path)
+        
+        # Check for orphaned files (files that exist but aren't in database)
+        orphaned_files = 0
+        if folder_path.exists():
+            # scandir gets the file type from the directory listing, without a stat per entry
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and not entry.name.endswith('.url'):  # Skip .url shortcuts
                         # Check if this file is tracked in database (case-insensitive)
-                        if abs_file_path.lower() not in db_file_paths:
+                        if entry.name.lower() not in db_file_names:
                             orphaned_files += 1
-                            logger.info(f"Found orphaned file (exists but not in database): {file_path.name}")
-            
-            # Commit any missing file deletions
-            if missing_files:
-                conn.commit()
-                logger.info(f"Database cleanup complete: removed {len(missing_files)} missing file records for pool {pool_id}")
-            else:
-                logger.info(f"All {len(records)} database records have corresponding files")
-                
-            if orphaned_files > 0:
-                logger.info(f"Found {orphaned_files} orphaned files that exist but aren't tracked in database")
-                logger.info("These files will be considered as needing re-download to ensure database consistency")
+                            logger.info("Found orphaned file (exists but not in database): %s", entry.name)
+        
+        # Commit any missing file deletions
+        if missing_files:
+            conn.commit()
+            logger.info("Database cleanup complete: removed %s missing file records for pool %s", len(missing_files), pool_id)
+        else:
+            logger.info("All %s database records have corresponding files", len(records))
             
-            return missing_files
+        if orphaned_files > 0:
+            logger.info("Found %s orphaned files that exist but aren't tracked in database", orphaned_files)
+            logger.info("These files will be considered as needing re-download to ensure database consistency")
+        
+        present_posts = {record[0] for record in records}.difference(missing_files)
+        return missing_files, present_posts
     
     def get_all_downloaded_pools(self):
         """Get all pools that have been downloaded."""
@@ -211,8 +287,11 @@ class DownloadDatabase:
     
     def get_pool_current_post_count(self, pool_id):
         """Get the current post count for a pool from the database."""
-        pool_info = self.get_pool_info(pool_id)
-        return pool_info['post_count'] if pool_info else 0
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT post_count FROM pools WHERE id = ?', (pool_id,))
+            row = cursor.fetchone()
+            return row[0] if row else 0
     
     def update_pool_post_count(self, pool_id, new_post_count):
         """Update the post count for a pool."""
@@ -224,4 +303,38 @@ class DownloadDatabase:
                 WHERE id = ?
             ''', (new_post_count, pool_id))
             conn.commit()
-            logger.debug(f"Updated pool {pool_id} post count to {new_post_count}")
+            logger.debug("Updated pool %s post count to %s", pool_id, new_post_count)
+    
+    def get_cached_response(self, url):
+        """Get the cached API response for a URL, if any."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT etag, last_modified, body FROM http_cache WHERE url = ?', (url,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def save_cached_response(self, url, etag, last_modified, body):
+        """Save an API response along with its validators."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO http_cache 
+                (url, etag, last_modified, body, fetched_at) 
+                VALUES (?, ?, ?, ?, ?)
+            ''', (url, etag, last_modified, body, time.time()))
+            conn.commit()
+            logger.debug("Cached response for %s (ETag: %s)", url, etag)
+    
+    def touch_cached_response(self, url):
+        """Mark a cached API response as just revalidated, so it isn't pruned."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE http_cache SET fetched_at = ? WHERE url = ?', (time.time(), url))
+            conn.commit()
+    
+    def delete_cached_response(self, url):
+        """Remove the cached API response for a URL."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+            conn.commit()
@@ -1,36 +1,138 @@
 """ Module for downloading images asynchronously """
 
+import asyncio
+import random
 import aiohttp
 import aiofiles
 import os
+import socket
 from backend.models import Post
+from backend.api_client import USER_AGENT, DNS_CACHE_TTL
 from backend.logger_config import logger
 
-async def download_image(post: Post, index, working_dir):
-    """Downloads an image asynchronously using aiohttp."""
+CHUNK_SIZE = 64 * 1024 # Bytes read from the response at a time
+WRITE_BUFFER_SIZE = 1024 * 1024 # Bytes collected before each file write, every write is a hop to a thread
+MAX_ATTEMPTS = 5 # Tries per file before giving up
+RETRY_STATUSES = {429, 500, 502, 503, 504} # Responses worth retrying after a pause
+MAX_RETRY_DELAY = 60 # Seconds, longest pause between attempts even if the server asks for more
+CONNECT_TIMEOUT = 30 # Seconds to open a connection to the file host
+READ_TIMEOUT = 60 # Seconds without receiving any data before a transfer is abandoned
+
+def _rcvbuf_size():
+    """Receive buffer size for file transfers from E6DL_SO_RCVBUF, in bytes.
+    0 when unset or invalid, which leaves the OS to tune the buffer itself."""
+    value = os.environ.get("E6DL_SO_RCVBUF", "")
+    if not value:
+        return 0
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning("Ignoring invalid E6DL_SO_RCVBUF value: %s", value)
+        return 0
+
+# Only set when asked for, a fixed SO_RCVBUF turns off Linux's receive window autotuning
+SO_RCVBUF_SIZE = _rcvbuf_size()
+
+def _download_socket(addr_info):
+    """Creates a socket for file transfers with Nagle's algorithm turned off,
+    and the receive buffer from E6DL_SO_RCVBUF if one was given."""
+    family, type_, proto, _, _ = addr_info
+    sock = socket.socket(family=family, type=type_, proto=proto)
+    if SO_RCVBUF_SIZE > 0:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SO_RCVBUF_SIZE)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def create_download_session(limit=8):
+    """Creates a session for file downloads, meant to be shared by all of them
+    so connections to the static file host are reused."""
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        keepalive_timeout=30,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        socket_factory=_download_socket
+    )
+    # No total timeout, a large video on a slow link can take as long as it needs while data keeps arriving
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+
+def _retry_delay(attempt, retry_after=None):
+    """Seconds to wait before the next attempt. Honours a numeric Retry-After
+    header, otherwise backs off exponentially with a little jitter.
+    Capped so a worker never sleeps for long while holding a download slot."""
+    if retry_after:
+        try:
+            return min(max(0.0, float(retry_after)), MAX_RETRY_DELAY)
+        except ValueError:
+            pass  # HTTP-date form, fall back to backoff
+    return min(2 ** (attempt - 1) + random.random(), MAX_RETRY_DELAY)
+
+def _remove_partial(part_path):
+    """Removes a partially written download, if there is one."""
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+async def download_image(session: aiohttp.ClientSession, post: Post, index, working_dir):
+    """Downloads an image asynchronously using a shared aiohttp session.
+    Rate limiting and server errors are retried with backoff.
+    Returns True if the file was saved."""
     if post.is_deleted:
-        logger.warning(f"Skipping deleted post {post.id}")
-        return
+        logger.warning("Skipping deleted post %s", post.id)
+        return False
 
     if not post.file_url:
-        logger.warning(f"Skipping post {post.id}, no URL found.")
-        return
+        logger.warning("Skipping post %s, no URL found.", post.id)
+        return False
 
     filename = f"{index + 1}.{post.file_ext}"
     path = os.path.join(working_dir, filename)
 
-    try:
-        async with aiohttp.ClientSession() as session:
+    # Write to a temporary file so an interrupted download never looks complete
+    part_path = f"{path}.part"
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
             async with session.get(post.file_url) as response:
-                if response.status != 200:
-                    logger.warning(f"Failed to download {post.file_url}: HTTP {response.status}")
-                    return
-
-                # Asynchronous file writing
-                async with aiofiles.open(path, "wb") as f:
-                    await f.write(await response.read())
-
-        logger.debug(f"Downloaded {path}")
-    
-    except aiohttp.ClientError as e:
-        logger.warning(f"Failed to download {post.file_url}: {e}")
+                if response.status in RETRY_STATUSES:
+                    error = f"HTTP {response.status}"
+                    delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+                else:
+                    response.raise_for_status()
+
+                    # Stream the body to disk instead of holding the whole file in memory
+                    try:
+                        async with aiofiles.open(part_path, "wb") as f:
+                            buffer = bytearray()
+                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                                buffer += chunk
+                                if len(buffer) >= WRITE_BUFFER_SIZE:
+                                    await f.write(buffer)
+                                    buffer.clear()
+                            if buffer:
+                                await f.write(buffer)
+
+                        os.replace(part_path, path)
+                    except BaseException:
+                        # Network errors, timeouts, cancellation and disk errors alike,
+                        # so a failed attempt never leaves a partial file in the pool folder
+                        _remove_partial(part_path)
+                        raise
+                    logger.debug("Downloaded %s", path)
+                    return True
+
+        except aiohttp.ClientResponseError as e:
+            # Any other error status won't be fixed by asking again
+            logger.warning("Failed to download %s: %s", post.file_url, e)
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # aiohttp raises a bare TimeoutError for read and total timeouts
+            error = e
+            delay = _retry_delay(attempt)
+
+        if attempt == MAX_ATTEMPTS:
+            break
+        logger.warning("Failed to download %s (%s), retrying in %.1fs (attempt %s/%s)", post.file_url, error, delay, attempt, MAX_ATTEMPTS)
+        await asyncio.sleep(delay)
+
+    logger.warning("Failed to download %s after %s attempts: %s", post.file_url, MAX_ATTEMPTS, error)
+    return False
@@ -22,22 +22,30 @@ formatter = colorlog.ColoredFormatter(
 
 # Create a logger
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)  # Default log level
 
-# Create a console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
+def _configure():
+    """Attach the console and file handlers to the logger."""
+    logger.setLevel(logging.WARNING)  # Default log level
 
-# Attach the handler to the logger
-logger.addHandler(console_handler)
+    # Create a console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
 
-# Create a rotating file handler that logs at the debug level
-file_handler = RotatingFileHandler('e6dl.log', maxBytes=10485760, backupCount=5)  # 10MB per file, keep 5 backups
-file_handler.setLevel(logging.DEBUG) # All levels will be logged
-file_handler.setFormatter(formatter)
+    # Attach the handler to the logger
+    logger.addHandler(console_handler)
 
-# Attach the file handler to the logger
-logger.addHandler(file_handler)
+    # Create a rotating file handler that logs at the debug level
+    # delay=True leaves e6dl.log unopened until the first record is written
+    file_handler = RotatingFileHandler('e6dl.log', maxBytes=10485760, backupCount=5, delay=True)  # 10MB per file, keep 5 backups
+    file_handler.setLevel(logging.DEBUG) # All levels will be logged
+    file_handler.setFormatter(formatter)
+
+    # Attach the file handler to the logger
+    logger.addHandler(file_handler)
+
+# The logger is shared by name, so a reloaded module must not attach a second set of handlers
+if not logger.handlers:
+    _configure()
 
 # Function to dynamically update log level
 def set_log_level(level: str):
@@ -46,6 +54,6 @@ def set_log_level(level: str):
     if level in ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]:
         logger.setLevel(getattr(logging, level))
         logging.getLogger().setLevel(getattr(logging, level))  # Apply globally
-        logger.debug(f"Log level set to {level}")
+        logger.debug("Log level set to %s", level)
     else:
-        logger.warning(f"Invalid log level: {level}. Using default.")
+        logger.warning("Invalid log level: %s. Using default.", level)
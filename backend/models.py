@@ -1,31 +1,42 @@
 """ Class structures for storing e621 api data """
 
+from functools import cached_property
 from backend.logger_config import logger
 
 class Pool:
     """Represents a pool on e621.net"""
     def __init__(self, data):
-        logger.debug(f"Pool data:\n{data}")
         try:
-            pool_data = data  # e621 API returns a list
-            self.id = pool_data["id"]
-            self.name = pool_data["name"].replace("_", " ")
-            self.post_ids = pool_data["post_ids"]
-            self.creator_name = pool_data["creator_name"]
-            self.post_count = pool_data["post_count"]
-        except (IndexError, KeyError):
+            self.id = data["id"]
+            self.name = data["name"].replace("_", " ")
+            self.post_ids = data["post_ids"]
+            self.creator_name = data["creator_name"]
+            self.post_count = data["post_count"]
+        except KeyError:
             raise ValueError("Invalid pool data received.")
+        logger.debug("Pool %s: %s posts", self.id, self.post_count)
 
 class Post:
     """Represents a post on e621.net"""
     def __init__(self, data):
-        logger.debug(f"Post data:\n{data}")
         try:
-            post_data = data["post"]  # e621 API returns a list
+            post_data = data["post"]
+            file_data = post_data["file"]
             self.artists = post_data["tags"]["artist"]
             self.id = post_data["id"]
             self.is_deleted = post_data["flags"]["deleted"]
-            self.file_url = post_data["file"]["url"]
-            self.file_ext = post_data["file"]["ext"]
-        except (IndexError, KeyError):
-            raise ValueError("Invalid post data received.")
\ No newline at end of file
+            self.file_url = file_data["url"]
+            self.file_ext = file_data["ext"]
+        except KeyError:
+            raise ValueError("Invalid post data received.")
+        logger.debug("Post %s: %s", self.id, self.file_ext)
+
+    @cached_property
+    def primary_artist(self):
+        """The artist used to name the pool folder, skipping the conditional_dnp tag."""
+        artists = self.artists
+        if not artists:
+            return "Unknown Artist"
+        if artists[0] == "conditional_dnp" and len(artists) > 1:
+            return artists[1]
+        return artists[0]
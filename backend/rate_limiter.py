@@ -0,0 +1,54 @@
+""" Admission control for requests to the e621 API """
+
+import asyncio
+import time
+from collections import deque
+
+class RateLimiter:
+    """Limits both how often requests are sent and how many are in flight.
+    Up to `burst` requests can be sent in any window of `burst / rate` seconds,
+    and at most `max_concurrency` can be waiting on a response at once.
+    Use as `async with limiter:` around the request."""
+
+    def __init__(self, rate=2, burst=2, max_concurrency=4):
+        self.max_concurrency = max_concurrency
+        self._burst = burst
+        self._window = burst / rate  # Seconds that may hold at most `burst` sends
+        self._sent = deque(maxlen=burst)  # Send times reserved by the most recent requests
+        self._active = 0  # Requests holding a reservation, sent or still waiting to be
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    async def acquire(self):
+        """Reserve the next free send slot, then wait for it outside the lock.
+        Callers queue up on staggered slots straight away instead of each
+        rechecking the window after sleeping."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.max_concurrency)
+            now = time.monotonic()
+            # _sent holds the last `burst` reservations, so the oldest one decides the next slot
+            if len(self._sent) < self._burst:
+                slot = now
+            else:
+                slot = max(now, self._sent[0] + self._window)
+            self._sent.append(slot)
+            self._active += 1
+
+        try:
+            await asyncio.sleep(slot - now)
+        except BaseException:
+            # Cancelled while waiting for the slot, give back the concurrency we took
+            await self.release()
+            raise
+
+    async def release(self):
+        """Mark a request as finished and wake one waiting caller."""
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify(1)
@@ -1,40 +1,89 @@
 """ This file contains utility functions for the project """
 
 import os
+import re
+import sys
+import asyncio
+import threading
+import aiofiles
 from pathlib import Path
 from backend.logger_config import logger
 
+# Translation table that deletes characters not allowed in file names
+_FORBIDDEN_CHARS = str.maketrans('', '', '<>:"/\\?*|')
+
+# A pool ID on its own or as the last path segment of a URL, allowing a trailing slash, query or fragment
+_POOL_ID_RE = re.compile(r"(?:^|/)(\d+)/?(?:[?#].*)?$")
+
 def create_directory(pool_name, artist, base_dir="."):
     """Creates a directory for the downloaded pool and returns the
     sanitized name of the directory."""
     sanitized_name = sanitize_filename(f"{pool_name} by {artist}")
-    logger.debug(f"Sanitized directory name: {sanitized_name}")
     
     # Create the full path using the base directory (current dir by default)
     base_path = Path(base_dir)
     full_path = base_path / sanitized_name
     
-    if not full_path.exists():
-        full_path.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Directory created: {full_path}")
-    else:
-        logger.info(f"Directory already exists: {full_path}")
+    # exist_ok covers a directory left behind by an earlier run without a separate check
+    full_path.mkdir(parents=True, exist_ok=True)
+    logger.info("Directory ready: %s", full_path)
     
     return str(full_path)
 
-def create_internet_shortcut(url, directory, name):
-    """Creates an internet shortcut file."""
-    shortcut_path = f"{directory}/{name}.url"
-    with open(shortcut_path, "w") as shortcut:
-        shortcut.write("[InternetShortcut]\n")
-        shortcut.write(f"URL={url}")
-    logger.debug(f"Internet shortcut created: {shortcut_path}")
+async def create_internet_shortcut(url, directory, name):
+    """Creates an internet shortcut file, leaving an existing one untouched."""
+    shortcut_path = os.path.join(directory, f"{name}.url")
+    try:
+        # Exclusive create, so a shortcut from an earlier run isn't rewritten
+        async with aiofiles.open(shortcut_path, "x") as shortcut:
+            await shortcut.write(f"[InternetShortcut]\nURL={url}")
+    except FileExistsError:
+        logger.debug("Internet shortcut already exists: %s", shortcut_path)
+        return
+    logger.debug("Internet shortcut created: %s", shortcut_path)
 
 def sanitize_filename(filename):
     """Removes illegal characters from folder names."""
-    forbidden_chars = ('<', '>', ':', '\"', '/', '\\', '?', '*', '|')
-    name = filename
-    for char in forbidden_chars:
-        name = name.replace(char, "")
-    logger.debug(f"Sanitized filename: {name}")
-    return name
\ No newline at end of file
+    return filename.translate(_FORBIDDEN_CHARS)
+
+def parse_pool_id(value):
+    """Extracts the pool ID from a pool ID or pool URL.
+    Returns None if the value doesn't end in a number, ignoring any trailing slash or query."""
+    match = _POOL_ID_RE.search(value.strip())
+    return int(match.group(1)) if match else None
+
+async def async_input(prompt=""):
+    """Reads a line from stdin without blocking the event loop.
+    Uses a daemon thread so an abandoned prompt can't hold up interpreter exit."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(method, value):
+        if not future.done():
+            method(value)
+
+    def read_line():
+        try:
+            print(prompt, end="", flush=True)
+            # Read the descriptor directly rather than through sys.stdin: a thread left
+            # blocked inside sys.stdin holds its buffer lock and aborts interpreter shutdown
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = os.read(sys.stdin.fileno(), 1024)
+                if not chunk:
+                    if not data:
+                        raise EOFError
+                    break
+                data += chunk
+            line = data.decode(sys.stdin.encoding or "utf-8", errors="replace").rstrip("\r\n")
+        except BaseException as e:
+            outcome = (future.set_exception, e)
+        else:
+            outcome = (future.set_result, line)
+        try:
+            loop.call_soon_threadsafe(resolve, *outcome)
+        except RuntimeError:
+            pass  # The loop already closed, nobody is waiting for the answer
+
+    threading.Thread(target=read_line, daemon=True).start()
+    return await future
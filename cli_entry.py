@@ -1,7 +1,13 @@
 import asyncio
 import argparse
 from backend.logger_config import set_log_level, logger
-from backend.backend import process_pool_ids, update_all_pools
+from backend.backend import E621Downloader, process_pool_ids, update_all_pools
+from backend.utils import parse_pool_id
+
+try:
+    import uvloop  # Optional, a faster event loop on Linux and macOS
+except ImportError:
+    uvloop = None
 
 async def main():
     """Command-line interface for downloading pools."""
@@ -15,7 +21,7 @@ async def main():
     args = parser.parse_args()
 
     # Set log level
-    logger.info(f"Setting log level to {args.log_level}")
+    logger.info("Setting log level to %s", args.log_level)
     set_log_level(args.log_level)
 
     # Handle update mode
@@ -25,7 +31,8 @@ async def main():
             print("⚠️  Pool IDs are ignored when using --update mode")
         
         logger.info("Checking all pools for updates...")
-        await update_all_pools(base_download_dir=args.download_dir)
+        async with E621Downloader(base_download_dir=args.download_dir) as downloader:
+            await update_all_pools(base_download_dir=args.download_dir, downloader=downloader)
         return
 
     raw_ids = args.pool_ids
@@ -34,10 +41,10 @@ async def main():
         logger.error("No pool IDs provided.")
         raw_ids = input("Enter pool IDs or URLs: ").split()
 
-    logger.debug(f"Input: {raw_ids}") 
+    logger.debug("Input: %s", raw_ids) 
 
     # Extract numeric pool IDs from URLs if necessary
-    pool_ids = [int(pool.split("/")[-1]) for pool in raw_ids if pool.split("/")[-1].isdigit()]
+    pool_ids = [pool_id for pool_id in map(parse_pool_id, raw_ids) if pool_id is not None]
 
     if not pool_ids:
         logger.error("No valid pool IDs provided.")
@@ -45,8 +52,9 @@ async def main():
 
     try:
         skip_existing = not args.force_redownload
-        total_posts = await process_pool_ids(pool_ids, skip_existing=skip_existing, base_download_dir=args.download_dir)
-        logger.info(f"Download complete. {len(total_posts) if total_posts else 0} failed downloads.")
+        async with E621Downloader(base_download_dir=args.download_dir) as downloader:
+            total_posts = await process_pool_ids(pool_ids, skip_existing=skip_existing, base_download_dir=args.download_dir, downloader=downloader)
+        logger.info("Download complete. %s failed downloads.", len(total_posts) if total_posts else 0)
     except asyncio.CancelledError:
         logger.warning("Download process interrupted.")
     finally:
@@ -55,7 +63,10 @@ async def main():
 def cli():
     """Entry point for console script"""
     try:
-        asyncio.run(main())
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.warning("Keyboard interrupt received. Cancelling tasks...")
 
@@ -67,7 +78,7 @@ def cli():
         try:
             loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
         except Exception as e:
-            logger.error(f"Exception during shutdown: {e}")
+            logger.error("Exception during shutdown: %s", e)
 
         logger.info("Exiting gracefully.")
 